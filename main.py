@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import glob
+import uuid
+import shutil
 import sys
-import json
-import requests
+import atexit
+import orjson
+import mmap
+import time
+import asyncio
+import sqlite3
+import hashlib
+import httpx
+import ijson
+import queue
 import logging
+import threading
+from array import array
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from dotenv import load_dotenv
 from rich.console import Console
 from rich.table import Table
@@ -20,21 +38,6 @@ from datetime import datetime
 # Initialize Rich console and logging
 console = Console()
 
-# Configure logging with rich handler
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(message)s",
-    datefmt="[%X]",
-    handlers=[
-        RichHandler(
-            rich_tracebacks=True,
-            markup=True,
-            show_time=True,
-            show_path=True
-        )
-    ]
-)
-
 # Create logger instance
 logger = logging.getLogger("qwen-engineer")
 
@@ -42,6 +45,17 @@ logger = logging.getLogger("qwen-engineer")
 logs_dir = Path("logs")
 logs_dir.mkdir(exist_ok=True)
 
+# Log records are rendered on the same console as everything else, so Rich keeps
+# their output and the streamed reply from tearing each other's lines
+rich_handler = RichHandler(
+    console=console,
+    rich_tracebacks=True,
+    markup=True,
+    show_time=True,
+    show_path=True
+)
+rich_handler.setFormatter(logging.Formatter("%(message)s", datefmt="[%X]"))
+
 # Add file handler for persistent logging
 file_handler = logging.FileHandler(
     logs_dir / f"qwen-engineer-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log",
@@ -50,7 +64,79 @@ file_handler = logging.FileHandler(
 file_handler.setFormatter(
     logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 )
-logger.addHandler(file_handler)
+file_handler.addFilter(logging.Filter(logger.name))
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Enqueues records untouched. The listener runs in this process, so there is no
+    need to pre-format them, and keeping exc_info lets RichHandler render tracebacks.
+    When the queue is full, DEBUG records are dropped and everything else waits.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno > logging.DEBUG:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+class LocalQueueListener(QueueListener):
+    """Waits for a free slot for the stop sentinel instead of failing on a full queue."""
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+# Callers only enqueue records; formatting, Rich rendering and file writes
+# happen on the listener's background thread
+log_queue = queue.Queue(maxsize=1024)
+log_listener = LocalQueueListener(log_queue, rich_handler, file_handler, respect_handler_level=True)
+logging.basicConfig(level=logging.INFO, handlers=[LocalQueueHandler(log_queue)])
+# Start the consumer together with the handler so a full queue never blocks
+# an importer; stopping at exit flushes whatever is still queued
+log_listener.start()
+atexit.register(log_listener.stop)
+
+def flush_logs() -> None:
+    """Wait until every queued log record has been rendered, e.g. before printing a prompt."""
+    log_queue.join()
+
+# httpx logs every request at INFO; keep the console for our own messages
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Streamed tokens are rendered by a background thread, so the receive loop
+# only hands text over and never waits on Rich
+token_queue = queue.Queue(maxsize=1024)
+
+def _drain_tokens() -> None:
+    while True:
+        tokens = [token_queue.get()]
+        # Render everything that is already waiting in a single console call
+        while True:
+            try:
+                tokens.append(token_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            # Model output is plain text: markup or highlighting could mangle it or raise
+            console.print("".join(tokens), end="", markup=False, highlight=False)
+        except Exception:
+            logger.debug("Failed to print streamed tokens", exc_info=True)
+        finally:
+            for _ in tokens:
+                token_queue.task_done()
+
+threading.Thread(target=_drain_tokens, name="token-printer", daemon=True).start()
+
+def print_token(text: str) -> None:
+    """Queue streamed text for printing. Blocks when the queue is full; tokens are never dropped."""
+    token_queue.put(text)
+
+def flush_tokens() -> None:
+    """Wait until every queued token has been printed."""
+    token_queue.join()
 
 # --------------------------------------------------------------------------------
 # 1. Configure Ollama client and load environment variables
@@ -58,6 +144,37 @@ logger.addHandler(file_handler)
 load_dotenv()  # Load environment variables from .env file
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 MODEL_NAME = "qwen2.5-coder:14b"
+EMBED_MODEL_NAME = "nomic-embed-text"
+
+# Semantic cache settings: a cached reply is reused when the new message embeds
+# within SEMANTIC_CACHE_MAX_DISTANCE (cosine) of a previous one asked against the same files
+SEMANTIC_CACHE_PATH = Path("cache") / "semantic-cache.sqlite3"
+SEMANTIC_CACHE_MAX_DISTANCE = 0.15
+SEMANTIC_CACHE_TTL = 24 * 60 * 60  # seconds
+NOCACHE_PREFIX = "/nocache"
+
+# Conversation turns are stored per session under logs/, outside the user's project;
+# requests carry only the most recent ones
+SESSION_DIR = logs_dir / "sessions"
+SESSION_WINDOW_TURNS = 20
+
+# Largest single write() issued when saving a file
+WRITE_CHUNK_SIZE = 4 * 1024 * 1024
+# Files larger than this are read through mmap
+MMAP_READ_THRESHOLD = 256 * 1024
+
+# Shared client so every request reuses pooled keep-alive connections to Ollama.
+# The transport retries failed connection attempts, e.g. while Ollama is starting up.
+_client = httpx.AsyncClient(
+    base_url=OLLAMA_BASE_URL,
+    timeout=None,
+    transport=httpx.AsyncHTTPTransport(
+        retries=3,
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+    )
+)
+# Request bodies are serialized with orjson and sent as raw content
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 # --------------------------------------------------------------------------------
 # 2. Define our schema using Pydantic for type safety
@@ -78,11 +195,14 @@ class FileToEdit(BaseModel):
     new_snippet: str
 
 class AssistantResponse(BaseModel):
-    assistant_reply: str
+    assistant_reply: str = ""
     files_to_create: Optional[List[FileToCreate]] = None
     # NEW: optionally hold diff edits
     files_to_edit: Optional[List[FileToEdit]] = None
 
+# Compiled validator used to parse assistant replies straight from JSON text
+_response_adapter = TypeAdapter(AssistantResponse)
+
 # --------------------------------------------------------------------------------
 # 3. System prompts
 # --------------------------------------------------------------------------------
@@ -169,34 +289,176 @@ system_PROMPT = dedent("""\
 # --------------------------------------------------------------------------------
 
 def read_local_file(file_path: str) -> str:
-    """Return the text content of a local file."""
-    logger.debug(f"Reading file: {file_path}")
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read()
-    logger.debug(f"Successfully read {len(content)} bytes from {file_path}")
+    """
+    Return the text content of a local file.
+    Large files are decoded straight from a memory map, skipping the read buffer copy.
+    """
+    logger.debug("Reading file: %s", file_path)
+    if os.path.getsize(file_path) > MMAP_READ_THRESHOLD:
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            content = str(m, "utf-8")
+        # Translate line endings the same way a text-mode read does
+        if "\r" in content:
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+    else:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    logger.debug("Successfully read %d bytes from %s", len(content), file_path)
     return content
 
+def _safe_read(file_path: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """Return (path, content, error); content is None and error is set if the file cannot be read."""
+    try:
+        return file_path, read_local_file(file_path), None
+    except (OSError, ValueError) as e:  # ValueError covers UnicodeDecodeError on binary files
+        return file_path, None, str(e)
+
+def read_local_files(file_paths: List[str]) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Read several files concurrently on a thread pool.
+    Returns (path, content, error) triples in input order; content is None for unreadable files.
+    """
+    if len(file_paths) <= 1:
+        return [_safe_read(path) for path in file_paths]
+    with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+        return list(executor.map(_safe_read, file_paths))
+
+def file_has_content(file_path: Path, data: bytes) -> bool:
+    """Return True if 'file_path' exists and holds exactly 'data'."""
+    try:
+        if os.path.getsize(file_path) != len(data):
+            return False
+        with open(file_path, "rb") as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def write_file(file_path: Path, content: str) -> None:
+    """
+    Write 'content' to 'file_path' as UTF-8. The parent directory must already exist.
+    The content is encoded once and written with as few write() calls as possible;
+    a file that already holds exactly this content is left untouched.
+    """
+    data = content.encode("utf-8")
+    if file_has_content(file_path, data):
+        logger.debug("File unchanged, skipping write: %s", file_path)
+        return
+
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view[:WRITE_CHUNK_SIZE])
+            view = view[written:]
+    finally:
+        os.close(fd)
+
 def create_file(path: str, content: str, project_dir: Path):
     """Create (or overwrite) a file at 'path' with the given 'content'."""
     file_path = project_dir / path
     file_path.parent.mkdir(parents=True, exist_ok=True)  # ensures any dirs exist
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+    write_file(file_path, content)
+    record_created_file(file_path, content)
+
+async def create_file_async(path: str, content: str, project_dir: Path) -> Path:
+    """Write a file on a worker thread. The caller creates parent dirs and records the result."""
+    file_path = project_dir / path
+    await asyncio.to_thread(write_file, file_path, content)
+    return file_path
+
+async def create_all(files: List[FileToCreate], project_dir: Path) -> None:
+    """Create all requested files concurrently, then record them in request order."""
+    # Concurrent writes to one path would interleave; as in sequential code, the last entry wins
+    files = list({normalize_path(str(project_dir / f.path)): f for f in files}.values())
+    for parent in {(project_dir / f.path).parent for f in files}:
+        parent.mkdir(parents=True, exist_ok=True)
+    file_paths = await asyncio.gather(*(create_file_async(f.path, f.content, project_dir) for f in files))
+    for file_path, file_info in zip(file_paths, files):
+        record_created_file(file_path, file_info.content)
+
+class StreamedFileWriter:
+    """
+    Parses a reply incrementally while it streams in and starts writing each entry of
+    'files_to_create' to a hidden staging file as soon as it is complete, overlapping
+    disk I/O with generation. commit() moves the staged files into place once the whole
+    reply has validated; discard() removes them otherwise and must run on every exit
+    path, including cancellation, or hidden files are left in the project. The files
+    are still recorded afterwards by create_all, whose unchanged-content check makes
+    its writes no-ops.
+    """
+
+    def __init__(self, project_dir: Path):
+        self.project_dir = project_dir
+        self._files = ijson.sendable_list()
+        self._parser = ijson.items_coro(self._files, "files_to_create.item")
+        # Resolved target path -> (staging path, content, write task); a later entry
+        # for the same path supersedes the earlier one, as in sequential code
+        self._staged: Dict[str, Tuple[Path, str, asyncio.Task]] = {}
+        self._superseded: List[Tuple[Path, str, asyncio.Task]] = []
+
+    def feed(self, content_chunk: str) -> None:
+        if self._parser is None:
+            return
+        try:
+            self._parser.send(content_chunk.encode("utf-8"))
+        except ijson.JSONError:
+            logger.debug("Streamed reply is not valid JSON; files will be written after parsing")
+            self._parser = None
+            return
+        for item in self._files:
+            if isinstance(item, dict) and isinstance(item.get("path"), str) and isinstance(item.get("content"), str):
+                target = normalize_path(str(self.project_dir / item["path"]))
+                staging_path = self.project_dir / f".{uuid.uuid4().hex}.partial"
+                task = asyncio.create_task(asyncio.to_thread(write_file, staging_path, item["content"]))
+                if target in self._staged:
+                    self._superseded.append(self._staged[target])
+                self._staged[target] = (staging_path, item["content"], task)
+        del self._files[:]
+
+    async def _settle(self) -> List[Tuple[str, Path, str, bool]]:
+        """Wait for every staging write; returns (target, staging path, content, succeeded)."""
+        entries = [(None, *entry) for entry in self._superseded]
+        entries += [(target, *entry) for target, entry in self._staged.items()]
+        # Shielded so a cancelled caller never abandons a write still running on its thread;
+        # entries are only forgotten once every write has finished
+        results = await asyncio.gather(
+            *(asyncio.shield(task) for _, _, _, task in entries), return_exceptions=True
+        )
+        self._staged, self._superseded = {}, []
+        return [
+            (target, staging_path, content, not isinstance(result, BaseException))
+            for (target, staging_path, content, _), result in zip(entries, results)
+        ]
+
+    async def commit(self) -> None:
+        """Move staged files into place. Anything that fails here is written again by create_all."""
+        for target, staging_path, content, succeeded in await self._settle():
+            if target is None or not succeeded:
+                staging_path.unlink(missing_ok=True)
+                continue
+            target_path = Path(target)
+            try:
+                if file_has_content(target_path, content.encode("utf-8")):
+                    staging_path.unlink()
+                    continue
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                if target_path.exists():
+                    shutil.copymode(target_path, staging_path)
+                os.replace(staging_path, target_path)
+            except OSError as e:
+                logger.debug("Could not move staged file into place: %s", e)
+                staging_path.unlink(missing_ok=True)
+
+    async def discard(self) -> None:
+        """Remove every staged file, e.g. when the reply failed to stream or validate."""
+        for _, staging_path, _, _ in await self._settle():
+            staging_path.unlink(missing_ok=True)
+
+def record_created_file(file_path: Path, content: str) -> None:
+    """Report a written file and add its content to the conversation context."""
     logger.info(f"Created/updated file: {file_path}")
     console.print(f"[green]✓[/green] Created/updated file at '[cyan]{file_path}[/cyan]'")
-    
-    # Record the action
-    conversation_history.append({
-        "role": "assistant",
-        "content": f"✓ Created/updated file at '{file_path}'"
-    })
-    
-    # Add the actual content to conversation context
-    normalized_path = normalize_path(str(file_path))
-    conversation_history.append({
-        "role": "system",
-        "content": f"Content of file '{normalized_path}':\n\n{content}"
-    })
+    add_file_to_context(normalize_path(str(file_path)), content)
 
 # NEW: Show the user a table of proposed edits and confirm
 def show_diff_table(files_to_edit: List[FileToEdit]) -> None:
@@ -210,61 +472,120 @@ def show_diff_table(files_to_edit: List[FileToEdit]) -> None:
     table.add_column("Original", style="red")
     table.add_column("New", style="green")
 
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     for edit in files_to_edit:
         table.add_row(edit.path, edit.original_snippet, edit.new_snippet)
-        logger.debug(f"Diff for {edit.path}:\nOriginal:\n{edit.original_snippet}\nNew:\n{edit.new_snippet}")
+        if debug_enabled:
+            logger.debug("Diff for %s:\nOriginal:\n%s\nNew:\n%s", edit.path, edit.original_snippet, edit.new_snippet)
     
+    flush_logs()
     console.print(table)
 
 # NEW: Apply diff edits
-def apply_diff_edit(path: str, original_snippet: str, new_snippet: str, project_dir: Path):
-    """Reads the file at 'path', replaces the first occurrence of 'original_snippet' with 'new_snippet', then overwrites."""
+def apply_diff_edits(files_to_edit: List[FileToEdit], project_dir: Path) -> None:
+    """Applies edits grouped by file, so every file is read and written once."""
+    edits_by_path: Dict[str, List[FileToEdit]] = {}
+    for edit in files_to_edit:
+        edits_by_path.setdefault(edit.path, []).append(edit)
+    for path, edits in edits_by_path.items():
+        apply_diff_edit(path, edits, project_dir)
+
+def apply_diff_edit(path: str, edits: List[FileToEdit], project_dir: Path):
+    """
+    Reads the file at 'path', replaces the first occurrence of each edit's 'original_snippet'
+    with its 'new_snippet' in order, each edit seeing the result of the previous ones,
+    then overwrites the file once.
+    """
+    file_path = project_dir / path
     try:
-        file_path = project_dir / path
-        logger.info(f"Applying diff edit to {file_path}")
-        content = read_local_file(file_path)
-        if original_snippet in content:
-            updated_content = content.replace(original_snippet, new_snippet, 1)
-            create_file(path, updated_content, project_dir)  # This will now also update conversation context
-            logger.info(f"Successfully applied diff edit to {file_path}")
-            console.print(f"[green]✓[/green] Applied diff edit to '[cyan]{file_path}[/cyan]'")
-            conversation_history.append({
-                "role": "assistant",
-                "content": f"✓ Applied diff edit to '{file_path}'"
-            })
-        else:
-            logger.warning(f"Original snippet not found in {file_path}")
-            console.print(f"[yellow]⚠[/yellow] Original snippet not found in '[cyan]{file_path}[/cyan]'. No changes made.", style="yellow")
-            console.print("\nExpected snippet:", style="yellow")
-            console.print(Panel(original_snippet, title="Expected", border_style="yellow"))
-            console.print("\nActual file content:", style="yellow")
-            console.print(Panel(content, title="Actual", border_style="yellow"))
+        logger.info(f"Applying {len(edits)} diff edit(s) to {file_path}")
+        updated_content = read_local_file(file_path)
     except FileNotFoundError:
         error_msg = f"File not found for diff editing: {file_path}"
         logger.error(error_msg)
         console.print(f"[red]✗[/red] {error_msg}", style="red")
+        return
+
+    applied = []
+    for edit in edits:
+        idx = updated_content.find(edit.original_snippet)
+        if idx < 0:
+            logger.warning(f"Original snippet not found in {file_path}")
+            console.print(f"[yellow]⚠[/yellow] Original snippet not found in '[cyan]{file_path}[/cyan]'. This edit was skipped.", style="yellow")
+            console.print("\nExpected snippet:", style="yellow")
+            console.print(Panel(edit.original_snippet, title="Expected", border_style="yellow"))
+            console.print("\nActual file content:", style="yellow")
+            console.print(Panel(updated_content, title="Actual", border_style="yellow"))
+            continue
+        updated_content = updated_content[:idx] + edit.new_snippet + updated_content[idx + len(edit.original_snippet):]
+        applied.append(edit)
+
+    if not applied:
+        return
+    create_file(path, updated_content, project_dir)  # This will now also update conversation context
+    for _ in applied:
+        logger.info(f"Successfully applied diff edit to {file_path}")
+        console.print(f"[green]✓[/green] Applied diff edit to '[cyan]{file_path}[/cyan]'")
+        conversation_history.append({
+            "role": "assistant",
+            "content": f"✓ Applied diff edit to '{file_path}'"
+        })
 
 def try_handle_add_command(user_input: str) -> bool:
     """
-    If user_input starts with '/add ', read that file and insert its content
-    into conversation as a system message. Returns True if handled; else False.
+    If user_input starts with '/add ', read that file (or every file matching a glob
+    pattern) and insert the content into conversation as a single system message.
+    Returns True if handled; else False.
     """
     prefix = "/add "
     if user_input.strip().lower().startswith(prefix):
-        file_path = user_input[len(prefix):].strip()
-        try:
-            logger.info(f"Adding file to conversation: {file_path}")
-            content = read_local_file(file_path)
+        pattern = user_input[len(prefix):].strip()
+        if any(ch in pattern for ch in "*?["):
+            file_paths = sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+            if not file_paths:
+                error_msg = f"No files match '{pattern}'"
+                logger.error(error_msg)
+                console.print(f"[red]✗[/red] {error_msg}\n", style="red")
+                return True
+        else:
+            file_paths = [pattern]
+
+        logger.info(f"Adding {len(file_paths)} file(s) to conversation: {pattern}")
+        added = []
+        for file_path, content, error in read_local_files(file_paths):
+            if content is None:
+                error_msg = f"Could not add file '{file_path}': {error}"
+                logger.error(error_msg)
+                console.print(f"[red]✗[/red] {error_msg}\n", style="red")
+            else:
+                added.append((file_path, content))
+        if not added:
+            return True
+
+        if len(added) == 1:
+            file_path, content = added[0]
             conversation_history.append({
                 "role": "system",
                 "content": f"Content of file '{file_path}':\n\n{content}"
-            })
+            }, pinned=True)
             logger.info(f"Successfully added file to conversation: {file_path}")
             console.print(f"[green]✓[/green] Added file '[cyan]{file_path}[/cyan]' to conversation.\n")
-        except OSError as e:
-            error_msg = f"Could not add file '{file_path}': {e}"
-            logger.error(error_msg)
-            console.print(f"[red]✗[/red] {error_msg}\n", style="red")
+            return True
+
+        # One message for the whole batch keeps conversation_history short
+        files_block = "\n".join(f"<file name=\"{file_path}\">\n{content}\n</file>" for file_path, content in added)
+        conversation_history.append({
+            "role": "system",
+            "content": f"Contents of files matching '{pattern}':\n\n{files_block}"
+        }, pinned=True)
+        logger.info(f"Successfully added {len(added)} files to conversation")
+        table = Table(title="Added to conversation", show_header=True, header_style="bold magenta")
+        table.add_column("File Path", style="cyan")
+        table.add_column("Characters", justify="right")
+        for file_path, content in added:
+            table.add_row(file_path, str(len(content)))
+        console.print(table)
+        console.print()
         return True
     return False
 
@@ -274,159 +595,381 @@ def ensure_file_in_context(file_path: str) -> bool:
     Returns True if successful, False if file not found.
     """
     try:
-        logger.debug(f"Ensuring file in context: {file_path}")
+        logger.debug("Ensuring file in context: %s", file_path)
         normalized_path = normalize_path(file_path)
+        if normalized_path in _file_messages:
+            return True
         content = read_local_file(normalized_path)
-        file_marker = f"Content of file '{normalized_path}'"
-        if not any(file_marker in msg["content"] for msg in conversation_history):
-            logger.debug(f"Adding file to conversation context: {normalized_path}")
-            conversation_history.append({
-                "role": "system",
-                "content": f"{file_marker}:\n\n{content}"
-            })
+        add_file_to_context(normalized_path, content)
         return True
-    except OSError:
-        error_msg = f"Could not read file '{file_path}' for editing context"
+    except (OSError, ValueError) as e:
+        error_msg = f"Could not read file '{file_path}' for editing context: {e}"
         logger.error(error_msg)
         console.print(f"[red]✗[/red] {error_msg}", style="red")
         return False
 
+@lru_cache(maxsize=1024)
 def normalize_path(path_str: str) -> str:
-    """Return a canonical, absolute version of the path."""
+    """
+    Return a canonical, absolute version of the path.
+    Memoized: the working directory never changes during a session.
+    """
     return str(Path(path_str).resolve())
 
 # --------------------------------------------------------------------------------
-# 5. Conversation state
+# 5. Response caching
+# --------------------------------------------------------------------------------
+
+class SemanticCache:
+    """
+    Sqlite-backed cache of assistant replies keyed by an embedding of the user message.
+    Entries are namespaced by a hash of the cache context (system prompt, files and
+    pinned messages), so a reply is only reused against the same files, in this run
+    or a later one.
+    """
+
+    def __init__(self, db_path: Path, max_distance: float = SEMANTIC_CACHE_MAX_DISTANCE, ttl: int = SEMANTIC_CACHE_TTL):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS reply_cache (
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                context_hash TEXT NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS reply_cache_lookup ON reply_cache (context_hash, created_at)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> array:
+        """Return the embedding as a unit-length float32 array, so cosine similarity is a dot product."""
+        norm = sum(x * x for x in embedding) ** 0.5 or 1.0
+        return array("f", (x / norm for x in embedding))
+
+    def lookup(self, embedding: List[float], context_hash: str) -> Optional[str]:
+        """Return the closest cached response within max_distance, or None."""
+        query = self._unit(embedding)
+        cutoff = int(time.time()) - self.ttl
+        best_response, best_distance = None, self.max_distance
+        rows = self.conn.execute(
+            "SELECT embedding, response FROM reply_cache WHERE context_hash = ? AND created_at >= ?",
+            (context_hash, cutoff)
+        )
+        for blob, response in rows:
+            cached = array("f")
+            cached.frombytes(blob)
+            if len(cached) != len(query):
+                continue
+            distance = 1.0 - sum(a * b for a, b in zip(query, cached))
+            if distance < best_distance:
+                best_response, best_distance = response, distance
+        if best_response is not None:
+            logger.debug("Semantic cache hit at cosine distance %.4f", best_distance)
+        return best_response
+
+    def store(self, embedding: List[float], response: str, context_hash: str) -> None:
+        self.conn.execute(
+            "INSERT INTO reply_cache (embedding, response, created_at, context_hash) VALUES (?, ?, ?, ?)",
+            (self._unit(embedding).tobytes(), response, int(time.time()), context_hash)
+        )
+        self.conn.commit()
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_PATH)
+
+# Cleared after the first failed embedding request, e.g. when the model is not pulled
+_embeddings_available = True
+
+async def get_embedding(text: str) -> Optional[List[float]]:
+    """
+    Embeds text with the local Ollama embedding model.
+    Returns None if the model is unavailable; the semantic cache is then disabled for the session.
+    """
+    global _embeddings_available
+    if not _embeddings_available:
+        return None
+    try:
+        response = await _client.post(
+            "/api/embeddings",
+            content=orjson.dumps({"model": EMBED_MODEL_NAME, "prompt": text}),
+            headers=JSON_HEADERS
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)["embedding"]
+    except Exception as e:
+        logger.warning(f"Could not compute embedding with {EMBED_MODEL_NAME}, semantic cache disabled: {str(e)}")
+        _embeddings_available = False
+        return None
+
+# In-memory LRU of raw replies keyed by a hash of the cache context and the user message
+_exact_cache: "OrderedDict[str, str]" = OrderedDict()
+EXACT_CACHE_MAX_ENTRIES = 256
+
+def hash_chat_request(messages: List[Dict[str, Any]]) -> str:
+    """Return a digest identifying a request (model, output format and messages)."""
+    request = {"model": MODEL_NAME, "format": "json", "messages": messages}
+    return hashlib.blake2b(orjson.dumps(request, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def exact_cache_get(key: str) -> Optional[str]:
+    content = _exact_cache.get(key)
+    if content is not None:
+        _exact_cache.move_to_end(key)
+    return content
+
+def exact_cache_put(key: str, content: str) -> None:
+    _exact_cache[key] = content
+    _exact_cache.move_to_end(key)
+    while len(_exact_cache) > EXACT_CACHE_MAX_ENTRIES:
+        _exact_cache.popitem(last=False)
+
+def print_cached_response(content: str, chunk_size: int = 64) -> None:
+    """Echo a cached reply in chunks, the same way a streamed reply is shown."""
+    flush_logs()
+    console.print("\nAssistant> ", style="bold blue", end="")
+    for i in range(0, len(content), chunk_size):
+        print_token(content[i:i + chunk_size])
+    flush_tokens()
+    console.print()
+
+# --------------------------------------------------------------------------------
+# 6. Conversation state
 # --------------------------------------------------------------------------------
-conversation_history = [
-    {"role": "system", "content": system_PROMPT}
-]
+class SessionStore:
+    """
+    Append-only sqlite log of the conversation for one session.
+    Requests send every pinned message plus a sliding window of the most recent
+    turns, so the payload stays bounded however long the session runs.
+    """
+
+    def __init__(self, db_path: Path, window: int = SESSION_WINDOW_TURNS):
+        self.window = window
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                pinned INTEGER NOT NULL DEFAULT 0,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def append(self, message: Dict[str, str], pinned: bool = False) -> None:
+        self.conn.execute(
+            "INSERT INTO turns (role, content, pinned, created_at) VALUES (?, ?, ?, ?)",
+            (message["role"], message["content"], int(pinned), int(time.time()))
+        )
+        self.conn.commit()
+
+    def recent_messages(self) -> List[Dict[str, str]]:
+        """Return pinned messages and the last 'window' unpinned ones, oldest first."""
+        rows = self.conn.execute("""
+            SELECT id, role, content FROM turns WHERE pinned = 1
+            UNION ALL
+            SELECT * FROM (SELECT id, role, content FROM turns WHERE pinned = 0 ORDER BY id DESC LIMIT ?)
+            ORDER BY id
+        """, (self.window,))
+        return [{"role": role, "content": content} for _, role, content in rows]
+
+    def pinned_messages(self) -> List[Dict[str, str]]:
+        """Return only the pinned messages, oldest first."""
+        rows = self.conn.execute("SELECT role, content FROM turns WHERE pinned = 1 ORDER BY id")
+        return [{"role": role, "content": content} for role, content in rows]
+
+_system_message = {"role": "system", "content": system_PROMPT}
+
+# Opened by main() once the project directory is known
+conversation_history: Optional[SessionStore] = None
+
+# Latest known content of every file in context: normalized path -> system message,
+# built once so it is not rebuilt on every request
+_file_messages: Dict[str, Dict[str, str]] = {}
+
+def add_file_to_context(path: str, content: str) -> None:
+    """Record the current content of a file (by normalized path) for future requests."""
+    logger.debug("Adding file to conversation context: %s", path)
+    _file_messages[path] = {"role": "system", "content": f"Content of file '{path}':\n\n{content}"}
+
+def build_messages() -> List[Dict[str, str]]:
+    """
+    Assemble the chat request so its prefix stays stable across turns, letting Ollama
+    reuse its KV cache: the system prompt, then one message per file in context in
+    path order, then the pinned and most recent conversation turns.
+    """
+    file_messages = [_file_messages[path] for path in sorted(_file_messages)]
+    return [_system_message] + file_messages + conversation_history.recent_messages()
+
+def build_cache_context() -> List[Dict[str, str]]:
+    """
+    The part of a request a cached reply must match: the system prompt, the files in
+    context and the pinned messages. Ordinary turns are left out so a repeated question
+    can hit; that is safe because replies that create or edit files are never cached.
+    """
+    file_messages = [_file_messages[path] for path in sorted(_file_messages)]
+    return [_system_message] + file_messages + conversation_history.pinned_messages()
 
 # --------------------------------------------------------------------------------
-# 6. OpenAI API interaction with streaming
+# 7. OpenAI API interaction with streaming
 # --------------------------------------------------------------------------------
 
+# Words that look like file paths: a recognized extension, or at least one '/'
+_PATH_RE = re.compile(r"[\w./\-]+\.(?:css|html|js|py|json|md)\b|[\w./\-]+/[\w./\-]+")
+
 def guess_files_in_message(user_message: str) -> List[str]:
     """
     Attempt to guess which files the user might be referencing.
-    Returns normalized absolute paths.
+    Returns normalized absolute paths of the candidates that exist on disk.
     """
-    recognized_extensions = [".css", ".html", ".js", ".py", ".json", ".md"]
     potential_paths = []
-    for word in user_message.split():
-        if any(ext in word for ext in recognized_extensions) or "/" in word:
-            path = word.strip("',\"")
-            try:
-                normalized_path = normalize_path(path)
-                potential_paths.append(normalized_path)
-            except (OSError, ValueError):
-                continue
+    for candidate in dict.fromkeys(_PATH_RE.findall(user_message)):
+        if not Path(candidate).exists():
+            continue
+        try:
+            potential_paths.append(normalize_path(candidate))
+        except (OSError, ValueError):
+            continue
     return potential_paths
 
-def stream_openai_response(user_message: str):
+async def stream_openai_response(user_message: str, workspace: Path):
     """
     Streams the Ollama chat completion response and handles structured output.
+    Replies are served from the exact-match or semantic cache when possible;
+    prefix the message with '/nocache' to bypass both.
     Returns the final AssistantResponse.
     """
     logger.info("Starting new chat completion request")
+
+    use_cache = not user_message.startswith(NOCACHE_PREFIX)
+    if not use_cache:
+        user_message = user_message[len(NOCACHE_PREFIX):].strip()
+        logger.debug("Response caches bypassed for this message")
     
     # Attempt to guess which file(s) user references
     potential_paths = guess_files_in_message(user_message)
-    logger.debug(f"Detected potential file paths: {potential_paths}")
+    logger.debug("Detected potential file paths: %s", potential_paths)
     
     valid_files = {}
 
-    # Try to read all potential files before the API call
-    for path in potential_paths:
-        try:
-            content = read_local_file(path)
-            valid_files[path] = content  # path is already normalized
-            file_marker = f"Content of file '{path}'"
-            # Add to conversation if we haven't already
-            if not any(file_marker in msg["content"] for msg in conversation_history):
-                logger.debug(f"Adding new file to conversation context: {path}")
-                conversation_history.append({
-                    "role": "system",
-                    "content": f"{file_marker}:\n\n{content}"
-                })
-        except OSError:
-            error_msg = f"Cannot proceed: File '{path}' does not exist or is not accessible"
+    # Read all potential files concurrently before the API call
+    for path, content, error in read_local_files(potential_paths):
+        if content is None:
+            error_msg = f"Cannot proceed: Could not read file '{path}': {error}"
             logger.error(error_msg)
             console.print(f"[red]✗[/red] {error_msg}", style="red")
             continue
+        valid_files[path] = content  # path is already normalized
+        add_file_to_context(path, content)
 
     # Now proceed with the API call
     conversation_history.append({"role": "user", "content": user_message})
     logger.debug("Added user message to conversation history")
 
+    # The message dicts are never mutated, so they are shared rather than rebuilt
+    messages = build_messages()
+    logger.debug("Prepared %d messages for API request", len(messages))
+
+    # Repeats of the same message against the same files and pinned messages are
+    # answered from memory; otherwise look for a semantically equivalent question
+    # asked in exactly the same context (everything but the new message)
+    cache_context = build_cache_context()
+    request_key = hash_chat_request(cache_context + [messages[-1]])
+    context_hash = hash_chat_request(cache_context)
+    embedding = None
+    cached_content = None
+    if use_cache:
+        cached_content = exact_cache_get(request_key)
+        if cached_content is not None:
+            logger.info("Serving response from exact-match cache")
+        else:
+            embedding = await get_embedding(" ".join(user_message.lower().split()))
+            if embedding is not None:
+                cached_content = semantic_cache.lookup(embedding, context_hash)
+                if cached_content is not None:
+                    logger.info("Serving response from semantic cache")
+
+    file_writer = None
     try:
-        # Format messages for Ollama API
-        messages = [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history]
-        logger.debug(f"Prepared {len(messages)} messages for API request")
-        
-        # Make streaming request to Ollama
-        logger.info(f"Making streaming request to Ollama API with model {MODEL_NAME}")
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={
-                "model": MODEL_NAME,
-                "messages": messages,
-                "stream": True,
-                "format": "json"
-            },
-            stream=True
-        )
-        response.raise_for_status()
-        logger.debug("Successfully initiated streaming response")
-
-        console.print("\nAssistant> ", style="bold blue", end="")
-        full_content = ""
-
-        for line in response.iter_lines():
-            if line:
-                try:
-                    chunk = json.loads(line)
-                    if "message" in chunk and "content" in chunk["message"]:
-                        content_chunk = chunk["message"]["content"]
-                        full_content += content_chunk
-                        console.print(content_chunk, end="")
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse streaming chunk as JSON")
-                    continue
+        if cached_content is not None:
+            print_cached_response(cached_content)
+            full_content = cached_content
+        else:
+            # Make streaming request to Ollama
+            logger.info(f"Making streaming request to Ollama API with model {MODEL_NAME}")
+            async with _client.stream(
+                "POST",
+                "/api/chat",
+                content=orjson.dumps({
+                    "model": MODEL_NAME,
+                    "messages": messages,
+                    "stream": True,
+                    "format": "json"
+                }),
+                headers=JSON_HEADERS
+            ) as response:
+                response.raise_for_status()
+                logger.debug("Successfully initiated streaming response")
 
-        console.print()
-        logger.debug("Finished receiving streaming response")
+                flush_logs()
+                console.print("\nAssistant> ", style="bold blue", end="")
+                full_content = ""
+                file_writer = StreamedFileWriter(workspace)
+
+                async for line in response.aiter_lines():
+                    if line:
+                        try:
+                            chunk = orjson.loads(line)
+                            if "message" in chunk and "content" in chunk["message"]:
+                                content_chunk = chunk["message"]["content"]
+                                full_content += content_chunk
+                                print_token(content_chunk)
+                                file_writer.feed(content_chunk)
+                        except orjson.JSONDecodeError:
+                            logger.warning("Failed to parse streaming chunk as JSON")
+                            continue
+
+            flush_tokens()
+            console.print()
+            logger.debug("Finished receiving streaming response")
 
         try:
             logger.debug("Attempting to parse full response as JSON")
-            parsed_response = json.loads(full_content)
-            
-            # Ensure assistant_reply is present
-            if "assistant_reply" not in parsed_response:
-                logger.debug("Adding empty assistant_reply to response")
-                parsed_response["assistant_reply"] = ""
+            # Parse and validate in one step, without an intermediate dict
+            response_obj = _response_adapter.validate_json(full_content)
+            # Replies that create or edit files are never cached, so a cache hit cannot replay them
+            cacheable = not response_obj.files_to_create and not response_obj.files_to_edit
 
             # If assistant tries to edit files not in valid_files, remove them
-            if "files_to_edit" in parsed_response and parsed_response["files_to_edit"]:
-                logger.info(f"Processing {len(parsed_response['files_to_edit'])} file edit requests")
+            if response_obj.files_to_edit:
+                logger.info(f"Processing {len(response_obj.files_to_edit)} file edit requests")
                 new_files_to_edit = []
-                for edit in parsed_response["files_to_edit"]:
+                for edit in response_obj.files_to_edit:
                     try:
-                        edit_abs_path = normalize_path(edit["path"])
+                        edit_abs_path = normalize_path(edit.path)
                         # If we have the file in context or can read it now
                         if edit_abs_path in valid_files or ensure_file_in_context(edit_abs_path):
-                            edit["path"] = edit_abs_path  # Use normalized path
+                            edit.path = edit_abs_path  # Use normalized path
                             new_files_to_edit.append(edit)
-                            logger.debug(f"Validated file edit for: {edit_abs_path}")
+                            logger.debug("Validated file edit for: %s", edit_abs_path)
                     except (OSError, ValueError):
-                        logger.warning(f"Invalid path in edit request: {edit['path']}")
-                        console.print(f"[yellow]⚠[/yellow] Skipping invalid path: '{edit['path']}'", style="yellow")
+                        logger.warning(f"Invalid path in edit request: {edit.path}")
+                        console.print(f"[yellow]⚠[/yellow] Skipping invalid path: '{edit.path}'", style="yellow")
                         continue
-                parsed_response["files_to_edit"] = new_files_to_edit
+                response_obj.files_to_edit = new_files_to_edit
 
-            response_obj = AssistantResponse(**parsed_response)
             logger.info("Successfully created AssistantResponse object")
 
+            # Only cache replies that parsed cleanly
+            if use_cache and cacheable:
+                exact_cache_put(request_key, full_content)
+            if embedding is not None and cached_content is None and cacheable:
+                semantic_cache.store(embedding, full_content, context_hash)
+
             # Save the assistant's textual reply to conversation
             conversation_history.append({
                 "role": "assistant",
@@ -434,9 +977,11 @@ def stream_openai_response(user_message: str):
             })
             logger.debug("Added assistant reply to conversation history")
 
+            if file_writer is not None:
+                await file_writer.commit()
             return response_obj
 
-        except json.JSONDecodeError:
+        except ValidationError:
             error_msg = "Failed to parse JSON response from assistant"
             logger.error(f"{error_msg}. Response content: {full_content[:200]}...")
             console.print(f"[red]✗[/red] {error_msg}", style="red")
@@ -446,6 +991,7 @@ def stream_openai_response(user_message: str):
             )
 
     except Exception as e:
+        flush_tokens()
         error_msg = f"Ollama API error: {str(e)}"
         logger.error(error_msg, exc_info=True)
         console.print(f"\n[red]✗[/red] {error_msg}", style="red")
@@ -453,17 +999,22 @@ def stream_openai_response(user_message: str):
             assistant_reply=error_msg,
             files_to_create=[]
         )
+    finally:
+        # Removes whatever was staged but not committed, also on Ctrl+C or cancellation;
+        # a no-op after a successful commit
+        if file_writer is not None:
+            await file_writer.discard()
 
-def get_project_name(user_message: str) -> str:
+async def get_project_name(user_message: str) -> str:
     """
     Makes an Ollama API call to get a suitable project name based on the user's initial message.
     Returns the project name as a string.
     """
     logger.info("Requesting project name from Ollama")
     try:
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={
+        response = await _client.post(
+            "/api/chat",
+            content=orjson.dumps({
                 "model": MODEL_NAME,
                 "messages": [
                     {"role": "system", "content": project_naming_PROMPT},
@@ -471,17 +1022,18 @@ def get_project_name(user_message: str) -> str:
                 ],
                 "stream": False,
                 "format": "json"
-            }
+            }),
+            headers=JSON_HEADERS
         )
         response.raise_for_status()
         
         try:
-            result = response.json()
+            result = orjson.loads(response.content)
             if "message" in result and "content" in result["message"]:
                 content = result["message"]["content"]
-                project_info = ProjectNameResponse.parse_raw(content)
+                project_info = ProjectNameResponse.model_validate(orjson.loads(content))
                 logger.info(f"Generated project name: {project_info.project_name}")
-                logger.debug(f"Project name explanation: {project_info.explanation}")
+                logger.debug("Project name explanation: %s", project_info.explanation)
                 return project_info.project_name
         except Exception as e:
             logger.error(f"Failed to parse project name response: {str(e)}")
@@ -506,10 +1058,10 @@ def get_unique_project_dir(base_name: str, projects_dir: Path) -> str:
     return f"{base_name}-{counter}"
 
 # --------------------------------------------------------------------------------
-# 7. Main interactive loop
+# 8. Main interactive loop
 # --------------------------------------------------------------------------------
 
-def main():
+async def main():
     logger.info(f"Starting Qwen Engineer session with model: {MODEL_NAME}")
     logger.info(f"Using Ollama API at: {OLLAMA_BASE_URL}")
     
@@ -520,13 +1072,14 @@ def main():
     
     # Get initial project description from user
     console.print("\nFirst, please describe your project idea:", style="bold cyan")
+    flush_logs()
     project_description = console.input("[bold green]You>[/bold green] ").strip()
     
     if not project_description:
         logger.warning("No project description provided, using default name")
         base_project_name = "unnamed-project"
     else:
-        base_project_name = get_project_name(project_description)
+        base_project_name = await get_project_name(project_description)
     
     # Create project directory with unique name
     projects_dir = Path("projects")
@@ -539,6 +1092,10 @@ def main():
     
     logger.info(f"Project directory created: {project_dir}")
     console.print(f"\n[green]✓[/green] Created project directory: [cyan]{project_dir}[/cyan]")
+
+    global conversation_history
+    SESSION_DIR.mkdir(exist_ok=True)
+    conversation_history = SessionStore(SESSION_DIR / f"{project_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.sqlite3")
     console.print(
         "\nTo include a file in the conversation, use '[bold magenta]/add path/to/file[/bold magenta]'.\n"
         "Type '[bold red]exit[/bold red]' or '[bold red]quit[/bold red]' to end.\n"
@@ -547,32 +1104,32 @@ def main():
     # Process the initial project description as the first message
     if project_description:
         logger.info("Processing initial project description")
-        response_data = stream_openai_response(project_description)
+        response_data = await stream_openai_response(project_description, project_dir)
 
         # Create any files if requested
         if response_data.files_to_create:
             logger.info(f"Processing {len(response_data.files_to_create)} file creation requests")
-            for file_info in response_data.files_to_create:
-                create_file(file_info.path, file_info.content, project_dir)
+            await create_all(response_data.files_to_create, project_dir)
 
         # Show and confirm diff edits if requested
         if response_data.files_to_edit:
             logger.info(f"Processing {len(response_data.files_to_edit)} file edit requests")
             show_diff_table(response_data.files_to_edit)
+            flush_logs()
             confirm = console.input(
                 "\nDo you want to apply these changes? ([green]y[/green]/[red]n[/red]): "
             ).strip().lower()
             
             if confirm == 'y':
                 logger.info("User confirmed file edits")
-                for edit_info in response_data.files_to_edit:
-                    apply_diff_edit(edit_info.path, edit_info.original_snippet, edit_info.new_snippet, project_dir)
+                apply_diff_edits(response_data.files_to_edit, project_dir)
             else:
                 logger.info("User rejected file edits")
                 console.print("[yellow]ℹ[/yellow] Skipped applying diff edits.", style="yellow")
 
     while True:
         try:
+            flush_logs()
             user_input = console.input("[bold green]You>[/bold green] ").strip()
         except (EOFError, KeyboardInterrupt):
             logger.info("Session terminated by keyboard interrupt")
@@ -588,39 +1145,39 @@ def main():
             break
 
         logger.info("Processing user input")
-        logger.debug(f"User input: {user_input}")
+        logger.debug("User input: %s", user_input)
 
         # If user is reading a file
         if try_handle_add_command(user_input):
             continue
 
         # Get streaming response from Ollama
-        response_data = stream_openai_response(user_input)
+        response_data = await stream_openai_response(user_input, project_dir)
 
         # Create any files if requested
         if response_data.files_to_create:
             logger.info(f"Processing {len(response_data.files_to_create)} file creation requests")
-            for file_info in response_data.files_to_create:
-                create_file(file_info.path, file_info.content, project_dir)
+            await create_all(response_data.files_to_create, project_dir)
 
         # Show and confirm diff edits if requested
         if response_data.files_to_edit:
             logger.info(f"Processing {len(response_data.files_to_edit)} file edit requests")
             show_diff_table(response_data.files_to_edit)
+            flush_logs()
             confirm = console.input(
                 "\nDo you want to apply these changes? ([green]y[/green]/[red]n[/red]): "
             ).strip().lower()
             
             if confirm == 'y':
                 logger.info("User confirmed file edits")
-                for edit_info in response_data.files_to_edit:
-                    apply_diff_edit(edit_info.path, edit_info.original_snippet, edit_info.new_snippet, project_dir)
+                apply_diff_edits(response_data.files_to_edit, project_dir)
             else:
                 logger.info("User rejected file edits")
                 console.print("[yellow]ℹ[/yellow] Skipped applying diff edits.", style="yellow")
 
+    await _client.aclose()
     logger.info("Session finished")
     console.print("[blue]Session finished.[/blue]")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())